@@ -0,0 +1,91 @@
+"""
+measures full updates of each provider against the replay server
+
+run from the repository root:
+
+    python benchmarks/latency.py
+    python benchmarks/latency.py --latency 300 --jitter 200 --error-rate 0.1
+    python benchmarks/latency.py --hang-rate 0.2 --hang 10  # test timeouts
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from replay_server import Behaviour, start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+providers = importlib.import_module("waybar-trains.providers")
+
+
+def measure(provider, runs: int, timeout: float, login: bool) -> tuple[list, int]:
+    """returns the seconds of each update and the number of failed updates"""
+    times = []
+    failures = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        if login:
+            provider.forget_login()
+            with provider._phase("login"):
+                provider.attempt_login()
+        status = provider.get_status(
+            conn_check=False, deadline=time.monotonic() + timeout
+        )
+        times.append(time.perf_counter() - start)
+        if status is None:
+            failures += 1
+    return times, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=10, help="in seconds")
+    parser.add_argument("--latency", type=float, default=0, help="in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0, help="in milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--hang-rate", type=float, default=0)
+    parser.add_argument("--hang", type=float, default=30, help="in seconds")
+    parser.add_argument(
+        "--login", action="store_true", help="also log in before each update"
+    )
+    parser.add_argument("--verbose", "-v", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.CRITICAL)
+
+    # don't use or change the real cache
+    os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp(prefix="waybar-trains-")
+
+    server = start_server(
+        Behaviour(
+            latency=args.latency / 1000,
+            jitter=args.jitter / 1000,
+            error_rate=args.error_rate,
+            hang_rate=args.hang_rate,
+            hang=args.hang,
+        )
+    )
+    host, port = server.server_address[:2]
+    base_url = f"http://{host}:{port}"
+
+    for name, provider_class in providers.PROVIDERS.items():
+        provider = provider_class(base_url=base_url)
+        times, failures = measure(provider, args.runs, args.timeout, args.login)
+        times_ms = sorted(t * 1000 for t in times)
+        print(
+            f"{name:10} median {statistics.median(times_ms):7.1f}ms, "
+            f"p90 {times_ms[int(len(times_ms) * 0.9) - 1]:7.1f}ms, "
+            f"max {times_ms[-1]:7.1f}ms, {failures}/{args.runs} failed"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+measures parsing and rendering of the recorded dummy data of all providers
+
+run from the repository root:
+
+    python benchmarks/parse_render.py
+    python benchmarks/parse_render.py --save baseline.json
+    python benchmarks/parse_render.py --compare baseline.json  # fail on regressions
+"""
+
+import argparse
+import copy
+import dataclasses
+import importlib
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+providers = importlib.import_module("waybar-trains.providers")
+utils = importlib.import_module("waybar-trains.providers.utils")
+
+# how to get the list of raw stops from each provider's data
+RAW_STOPS: dict[str, Callable[[Any], list]] = {
+    "iceportal": lambda data: data.trip["trip"]["stops"],
+    "zugportal": lambda data: data["stops"],
+    "odeg": lambda data: data["course"]["stops"],
+}
+
+# numbers of stops of the synthetic trips, in addition to the recorded ones
+SCALES = [100, 500]
+
+
+def shift_stop(stop: Any, suffix: str, offset: timedelta) -> Any:
+    """returns a copy of a raw stop with its times shifted and `suffix` added to ids"""
+    if isinstance(stop, list):
+        return [shift_stop(value, suffix, offset) for value in stop]
+    if not isinstance(stop, dict):
+        return stop
+    shifted = {}
+    for key, value in stop.items():
+        if isinstance(value, int) and key.endswith(("Time", "TimeInMs")):
+            value += int(offset / timedelta(milliseconds=1))
+        elif isinstance(value, str) and key.endswith("Planned"):
+            value = (datetime.fromisoformat(value) + offset).isoformat()
+        elif isinstance(value, str) and key in ("name", "id", "evaNr", "evaNo"):
+            value += suffix
+        else:
+            value = shift_stop(value, suffix, offset)
+        shifted[key] = value
+    return shifted
+
+
+def scale_data(name: str, data: Any, count: int) -> Any:
+    """returns a copy of `data` whose trip is repeated until it has `count` stops"""
+    status = providers.PROVIDERS[name]()._get_status_from_data(data)
+    times = [t.real for stop in status.stops if (t := stop.estimated_departure())]
+    # each repetition starts after the previous one
+    duration = times[-1] - times[0] + timedelta(minutes=10)
+
+    data = copy.deepcopy(data)
+    stops = RAW_STOPS[name](data)
+    original = list(stops)
+    stops.clear()
+    for i in range(count):
+        repetition, position = divmod(i, len(original))
+        # the first repetition is unchanged, so that references to its stops still work
+        suffix = f" {repetition}" if repetition else ""
+        stops.append(shift_stop(original[position], suffix, duration * repetition))
+    return data
+
+
+def get_benchmarks(name: str, data: Any, now: datetime) -> dict[str, Callable[[], Any]]:
+    provider_class = providers.PROVIDERS[name]
+    provider = provider_class()
+    status = provider._get_status_from_data(data)
+    stops = status.stops
+    if not status.next_stop:
+        # like the providers do, otherwise the tooltip is empty
+        status = dataclasses.replace(
+            status, next_stop=utils.estimate_next_stop(stops, now, status.departures)
+        )
+
+    def update():
+        # a full update with a new provider, so that nothing is reused
+        status = provider_class()._get_status_from_data(data)
+        utils.estimate_next_stop(status.stops, now, status.departures)
+        status.get_text()
+        status.get_tooltip()
+
+    def text():
+        # resets the memo instead of creating a new status, which would be measured too
+        object.__setattr__(status, "_text", None)
+        return status.get_text()
+
+    def tooltip():
+        object.__setattr__(status, "_tooltip", None)
+        return status.get_tooltip()
+
+    return {
+        "parse": lambda: provider_class()._get_status_from_data(data),
+        "parse_again": lambda: provider._get_status_from_data(data),
+        "next_stop": lambda: utils.estimate_next_stop(stops, now, status.departures),
+        # the stops keep their own memos, as after an update without changes
+        "text": text,
+        "tooltip": tooltip,
+        "text_cached": status.get_text,
+        "tooltip_cached": status.get_tooltip,
+        "update": update,
+    }
+
+
+def run(repeat: int) -> dict[str, float]:
+    """returns the seconds per call of each benchmark"""
+    results = {}
+    for name, provider_class in providers.PROVIDERS.items():
+        data, now = provider_class()._get_dummy_data()
+        count = len(RAW_STOPS[name](data))
+        trips = {f"{count} stops": data}
+        for scale in SCALES:
+            trips[f"{scale} stops"] = scale_data(name, data, scale)
+        for trip, trip_data in trips.items():
+            for benchmark, function in get_benchmarks(name, trip_data, now).items():
+                timer = timeit.Timer(function)
+                number, _ = timer.autorange()
+                seconds = min(timer.repeat(repeat, number)) / number
+                key = f"{name} {trip} {benchmark}"
+                results[key] = seconds
+                print(f"{key:40} {seconds * 1e6:10.1f}µs ({number} calls)")
+    return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float):
+    """prints the change against `baseline` and returns if any result regressed"""
+    regressed = False
+    print()
+    for key, seconds in results.items():
+        if key not in baseline:
+            continue
+        ratio = seconds / baseline[key]
+        mark = ""
+        if ratio > tolerance:
+            mark = "  REGRESSION"
+            regressed = True
+        print(f"{key:40} {ratio:6.2f}x{mark}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", metavar="FILE", help="save the results as baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.25,
+        help="maximum ratio to the baseline before failing (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit("performance regressed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+serves the recorded dummy data like the portals on a train, for use with --base-url
+
+run from the repository root:
+
+    python benchmarks/replay_server.py --latency 200 --jitter 100 --error-rate 0.1
+    python -m waybar-trains --no-conn-check --base-url http://127.0.0.1:8080
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+
+DUMMY_DATA = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "waybar-trains",
+    "providers",
+    "_dummy_data",
+)
+
+# (method, /<host>/<path>) -> file in DUMMY_DATA, or the response itself
+ROUTES: dict[tuple[str, str], str | dict] = {
+    (
+        "GET",
+        "/iceportal.de/api1/rs/tripInfo/trip",
+    ): "2021-08-31T12-02-55-ice1601/trip.json",
+    ("GET", "/iceportal.de/api1/rs/status"): "2021-08-31T12-02-55-ice1601/status.json",
+    ("POST", "/login.wifionice.de/cna/logon"): {},
+    ("GET", "/login.wifionice.de/cna/health/venue"): {"result": {"healthy": True}},
+    (
+        "GET",
+        "/zugportal.de/@prd/zupo-travel-information/api/public/ri/journey",
+    ): "2024-05-10T19-40-10-db-re4430/journey.json",
+    (
+        "POST",
+        "/wasabi.hotspot-local.unwired.at/api/graphql",
+    ): "2024-04-13T20-20-00-odeg-re1/graphql.json",
+}
+
+
+class Behaviour(NamedTuple):
+    latency: float = 0
+    """seconds before each response"""
+    jitter: float = 0
+    """maximum seconds randomly added to `latency`"""
+    error_rate: float = 0
+    """probability of responding with an internal server error"""
+    hang_rate: float = 0
+    """probability of not responding for `hang` seconds, to trigger timeouts"""
+    hang: float = 30
+
+
+def load_routes() -> dict[tuple[str, str], bytes]:
+    routes = {}
+    for route, response in ROUTES.items():
+        if isinstance(response, str):
+            with open(os.path.join(DUMMY_DATA, response), "rb") as f:
+                routes[route] = f.read()
+        else:
+            routes[route] = json.dumps(response).encode()
+    return routes
+
+
+def make_handler(
+    behaviour: Behaviour, routes: dict[tuple[str, str], bytes], quiet=False
+):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.respond("GET")
+
+        def do_POST(self):
+            # the request body is not used, but has to be read
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self.respond("POST")
+
+        def respond(self, method: str):
+            body = routes.get((method, self.path.split("?")[0]))
+            if body is None:
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            time.sleep(behaviour.latency + random.uniform(0, behaviour.jitter))
+            if random.random() < behaviour.hang_rate:
+                time.sleep(behaviour.hang)
+            if random.random() < behaviour.error_rate:
+                self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR)
+                return
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            if not quiet:
+                super().log_message(format, *args)
+
+    return ReplayHandler
+
+
+def start_server(
+    behaviour: Behaviour, host="127.0.0.1", port=0, quiet=True
+) -> ThreadingHTTPServer:
+    """starts the server on a daemon thread, use its `server_address` to connect"""
+    server = ThreadingHTTPServer(
+        (host, port), make_handler(behaviour, load_routes(), quiet)
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0, help="in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0, help="in milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--hang-rate", type=float, default=0)
+    parser.add_argument("--hang", type=float, default=30, help="in seconds")
+    args = parser.parse_args()
+
+    behaviour = Behaviour(
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        hang_rate=args.hang_rate,
+        hang=args.hang,
+    )
+    server = ThreadingHTTPServer(
+        (args.host, args.port), make_handler(behaviour, load_routes())
+    )
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+measures the startup time of waybar-trains when not connected to a train network
+
+run from the repository root while not connected to a train's WiFi:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --importtime  # show slowest imports
+    python benchmarks/startup.py --max-ms 50   # fail if the median is slower
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(python: str, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [python, *args, "-m", "waybar-trains"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+
+
+def measure(python: str, runs: int) -> list[float]:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = run(python)
+        times.append((time.perf_counter() - start) * 1000)
+        if result.stdout:
+            sys.exit(
+                "waybar-trains produced output, "
+                "this benchmark must be run while not connected to a train"
+            )
+    return times
+
+
+def importtime(python: str, count: int):
+    """prints the imports with the largest cumulative time"""
+    result = run(python, "-X", "importtime")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    rows.sort(reverse=True)
+    print(f"{'cumulative':>12} {'self':>8}  module")
+    for cumulative_us, self_us, name in rows[:count]:
+        print(f"{cumulative_us / 1000:10.1f}ms {self_us / 1000:6.1f}ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument(
+        "--importtime",
+        nargs="?",
+        type=int,
+        const=20,
+        metavar="COUNT",
+        help="print the COUNT slowest imports (default: 20)",
+    )
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        help="exit with an error if the median wall-clock time exceeds this",
+    )
+    args = parser.parse_args()
+
+    if args.importtime:
+        importtime(args.python, args.importtime)
+        print()
+
+    run(args.python)  # warm up the file system cache and bytecode
+    times = measure(args.python, args.runs)
+    median = statistics.median(times)
+    print(
+        f"not connected: median {median:.1f}ms, "
+        f"min {min(times):.1f}ms, max {max(times):.1f}ms ({args.runs} runs)"
+    )
+
+    if args.max_ms is not None and median > args.max_ms:
+        sys.exit(f"median startup time {median:.1f}ms exceeds {args.max_ms:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,44 @@
+import sys
+
+from .broker import run_client
+
+# the package is run with -m, so that its name is known
+PACKAGE = __package__ or "waybar-trains"
+
+# a client of the broker only prints its output, before importing anything else
+if "--broker" in sys.argv[1:] and not {"-h", "--help"} & set(sys.argv[1:]):
+    if run_client(PACKAGE, sys.argv[1:]):
+        sys.exit()
+
 import argparse
 import json
 import logging
-import sys
+import os
+import subprocess
+import threading
+import time
+from typing import Callable
 
-import requests
-
-from .providers import PROVIDERS
+from .broker import Broker, get_socket_path
+from .providers import (
+    PROVIDERS,
+    Probe,
+    forget_misses,
+    get_connected_providers,
+    order_providers,
+    record_probe,
+)
+from .providers.base import BaseProvider
+from .providers.cache import SavedStatus, load_status, save_status, try_lock
+from .providers.metrics import format_timings, write_metrics
+from .providers.schedule import Scheduler, load_schedule, save_schedule
+from .providers.types import Status
+from .providers.utils import (
+    advance_next_stop,
+    clear_connection_cache,
+    extrapolate_delay,
+)
+from .providers.watch import ConnectionWatcher, get_connection_watcher
 
 parser = argparse.ArgumentParser(
     prog="waybar-trains",
@@ -32,10 +65,127 @@ parser.add_argument(
     help="Use dummy data of the given provider",
 )
 
+parser.add_argument(
+    "--daemon",
+    "-d",
+    action="store_true",
+    help="Keep running and print a JSON line whenever the output changes "
+    '(use without Waybar\'s "interval" option)',
+)
+
+parser.add_argument(
+    "--interval",
+    type=float,
+    default=15,
+    help="Seconds between updates when nothing is known about the trip, should "
+    "match the interval in Waybar if not in daemon mode (default: %(default)s)",
+)
+
+parser.add_argument(
+    "--fixed-interval",
+    action="store_true",
+    help="Always update after the interval, instead of less often while the next "
+    "stop is far away and more often when approaching it",
+)
+
+parser.add_argument(
+    "--broker",
+    action="store_true",
+    help="Get the output from a background process that is shared by all instances "
+    "with the same options, e.g. with one bar per monitor, and started if needed",
+)
+
+parser.add_argument(
+    "--serve",
+    action="store_true",
+    help=argparse.SUPPRESS,  # used internally to run the broker
+)
+
+parser.add_argument(
+    "--no-watch",
+    action="store_true",
+    help="In daemon mode, check the connected WiFi networks periodically instead of "
+    "waiting for connection events",
+)
+
+parser.add_argument(
+    "--countdown",
+    action="store_true",
+    help="Show the minutes until the arrival at the next stop",
+)
+
 parser.add_argument(
     "--verbose", "-v", action="store_true", help="Output debug information to stderr"
 )
 
+parser.add_argument(
+    "--timeout",
+    type=float,
+    default=10,
+    help="Seconds after which an update is given up and the last status is shown "
+    "instead, while it is refreshed in the background (default: %(default)s)",
+)
+
+parser.add_argument(
+    "--max-stale",
+    type=float,
+    default=600,
+    metavar="SECONDS",
+    help="Maximum age of the last status to show if an update times out "
+    "(default: %(default)s)",
+)
+
+parser.add_argument(
+    "--max-offline",
+    type=float,
+    default=1800,
+    metavar="SECONDS",
+    help="Maximum age of the last status to continue from with estimated times while "
+    "connected to a train network whose portal does not respond, e.g. in tunnels "
+    "(default: %(default)s)",
+)
+
+parser.add_argument(
+    "--refresh",
+    action="store_true",
+    help=argparse.SUPPRESS,  # used internally to refresh the status in the background
+)
+
+parser.add_argument(
+    "--base-url",
+    metavar="URL",
+    help="Send requests for https://<host>/<path> to URL/<host>/<path> instead, "
+    "e.g. to a replay server for testing",
+)
+
+parser.add_argument(
+    "--dump-payloads",
+    metavar="FILE",
+    help="Append all data fetched from the portals to FILE",
+)
+
+parser.add_argument(
+    "--dump-max-size",
+    type=int,
+    default=1_000_000,
+    metavar="BYTES",
+    help="Maximum size of the --dump-payloads file before it is rotated "
+    "(default: %(default)s)",
+)
+
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Output the time spent in each phase of an update to stderr",
+)
+
+parser.add_argument(
+    "--metrics",
+    metavar="FILE",
+    help="Append the time spent in each phase of an update as JSON line to FILE, "
+    "or write it for the Prometheus node exporter if FILE ends with .prom",
+)
+
 parser.add_argument(
     "--human",
     "-H",
@@ -53,33 +203,375 @@ logging.basicConfig(
 )
 logger = logging.getLogger("waybar-trains")
 
+payload_logger = logging.getLogger("waybar-trains.payload")
+payload_logger.propagate = False
+if args.dump_payloads:
+    from logging.handlers import RotatingFileHandler
 
-if args.dummy:
-    provider_name = args.dummy
-    provider = PROVIDERS[provider_name]()
-    status = provider.get_dummy_status()
+    handler = RotatingFileHandler(
+        args.dump_payloads, maxBytes=args.dump_max_size, backupCount=1
+    )
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    payload_logger.addHandler(handler)
+    payload_logger.setLevel(logging.DEBUG)
 else:
-    session = requests.Session()
-    status = None
-    provider_name = None
-    for provider_class in PROVIDERS.values():
-        provider_name = provider_class.NAME
-        provider = provider_class(session)
-        status = provider.get_status(
-            conn_check=not args.no_conn_check, login=args.login
-        )
-        if status is not None:
-            break
+    payload_logger.setLevel(logging.CRITICAL)
+
+
+# time for a status refresh in the background, where nobody is waiting for it
+REFRESH_TIMEOUT = 60
+# seconds between renders of the last status in daemon mode, between updates
+RENDER_INTERVAL = 10
+
+
+def get_candidates(providers: dict[str, BaseProvider]) -> list[BaseProvider]:
+    if args.no_conn_check:
+        return list(providers.values())
+    return [providers[name] for name in get_connected_providers()]
+
+
+def start_probe(candidates: list[BaseProvider], timeout: float) -> Probe:
+    """
+    probes the provider that last had a status on this network first, and skips those
+    whose connection check just failed
+    """
+    if not args.no_conn_check:
+        # reuses the scan of the connected networks for the candidates
+        candidates = order_providers(candidates)
+    return Probe(
+        candidates,
+        conn_check=not args.no_conn_check,
+        login=args.login,
+        deadline=time.monotonic() + timeout,
+    )
+
+
+def get_probe_result(
+    probe: Probe, timeout: float, scheduler: Scheduler | None = None
+) -> SavedStatus | None:
+    """
+    waits for the probe and returns its status, and schedules the next update
+    raises TimeoutError if the probe does not finish in time
+    """
+    try:
+        provider, status = probe.result(timeout)
+    finally:
+        report_timings(probe)
+    if not args.no_conn_check:
+        try:
+            record_probe(probe.providers, provider)
+        except OSError:
+            logger.exception("Could not save probed providers")
+    if scheduler is not None:
+        scheduler.connected = [p.NAME for p in probe.providers if p.connected]
+        scheduler.update(status)
+    if provider is None or status is None:
+        return None
+    try:
+        save_status(provider.NAME, status)
+    except OSError:
+        logger.exception("Could not save status")
+    return SavedStatus(provider.NAME, status, time.time())
+
+
+def report_timings(probe: Probe):
+    if not args.profile and not args.metrics:
+        return
+    timings = {p.NAME: dict(p.timings) for p in probe.providers if p.timings}
+    if args.profile:
+        for name, provider_timings in timings.items():
+            print(format_timings(name, provider_timings), file=sys.stderr)
+    if args.metrics:
+        try:
+            write_metrics(args.metrics, timings)
+        except OSError:
+            logger.exception("Could not write metrics")
+
+
+def get_saved_status(
+    providers: list[BaseProvider], max_age: float
+) -> SavedStatus | None:
+    saved = load_status(max_age)
+    if saved is None or saved.provider not in (p.NAME for p in providers):
+        return None
+    logger.info(f"Showing status of {saved.provider} from {time.ctime(saved.time)}")
+    return saved
+
+
+def get_offline_status(providers: list[BaseProvider]) -> SavedStatus | None:
+    """returns the last status to continue from while the providers do not respond"""
+    saved = get_saved_status(providers, args.max_offline)
+    if saved is None:
+        return None
+    return saved._replace(status=advance_next_stop(extrapolate_delay(saved.status)))
+
+
+def get_schedule(candidates: list[BaseProvider]) -> Scheduler | None:
+    if args.fixed_interval:
+        return None
+    return load_schedule(args.interval, [p.NAME for p in candidates])
+
 
-if status is not None:
-    output = {
-        "text": status.get_text(),
+def store_schedule(scheduler: Scheduler | None):
+    if scheduler is None:
+        return
+    try:
+        save_schedule(scheduler)
+    except OSError:
+        logger.exception("Could not save schedule")
+
+
+def start_refresh():
+    """refreshes the saved status in a separate process, which outlives this one"""
+    refresh_args = ["--refresh"]
+    if args.no_conn_check:
+        refresh_args.append("--no-conn-check")
+    if args.login:
+        refresh_args.append("--login")
+    if args.base_url:
+        refresh_args += ["--base-url", args.base_url]
+    if args.fixed_interval:
+        refresh_args.append("--fixed-interval")
+    refresh_args += ["--interval", str(args.interval)]
+    subprocess.Popen(
+        [sys.executable, "-m", PACKAGE, *refresh_args],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def render(
+    saved: SavedStatus | None, stale=False, estimated=False, advance=True
+) -> dict | None:
+    """
+    returns the output of `saved`
+    `advance` estimates the next stop again, for a status that was fetched earlier
+    """
+    if saved is None:
+        return None
+    status = advance_next_stop(saved.status) if advance else saved.status
+    return get_output(saved.provider, status, stale, estimated)
+
+
+def get_output(
+    provider_name: str | None, status: Status | None, stale=False, estimated=False
+) -> dict | None:
+    if status is None:
+        return None
+    classes = [f"provider-{provider_name}"]
+    if stale:
+        classes.append("stale")
+    if estimated:
+        classes.append("estimated")
+    return {
+        "text": status.get_text(countdown=args.countdown),
         # "alt": "$alt",
         "tooltip": status.get_tooltip(),
-        "class": f"provider-{provider_name}",
+        "class": classes if len(classes) > 1 else classes[0],
     }
-    print(
+
+
+def format_output(output: dict) -> str:
+    return (
         json.dumps(output)
         if not args.human
         else json.dumps(output, indent=2, ensure_ascii=False)
     )
+
+
+def print_output(output: dict):
+    print(format_output(output), flush=True)
+
+
+def run_once(providers: dict[str, BaseProvider]):
+    candidates = get_candidates(providers)
+    if not candidates:
+        return
+    scheduler = get_schedule(candidates)
+    if scheduler is not None and not scheduler.is_due():
+        # nothing is expected to have changed, or the providers keep failing
+        logger.info(f"Next update in {scheduler.get_delay():.0f}s")
+        if scheduler.failures:
+            # like after the failed update, only if the portal was reachable then
+            connected = [p for p in candidates if p.NAME in scheduler.connected]
+            output = render(get_offline_status(connected), estimated=True)
+        else:
+            output = render(get_saved_status(candidates, args.max_stale))
+        if output is not None:
+            print_output(output)
+        return
+    probe = start_probe(candidates, args.timeout)
+    try:
+        saved = get_probe_result(probe, args.timeout, scheduler)
+        store_schedule(scheduler)
+    except TimeoutError:
+        logger.warning("Update timed out")
+        start_refresh()
+        output = render(get_saved_status(probe.providers, args.max_stale), stale=True)
+    else:
+        if saved is not None:
+            output = render(saved, advance=False)
+        else:
+            # connected, but the portal does not respond
+            connected = [p for p in probe.providers if p.connected]
+            output = render(get_offline_status(connected), estimated=True)
+    # always printed, even if unchanged: Waybar hides the module if a script run by
+    # interval prints nothing
+    if output is not None:
+        print_output(output)
+
+
+def run_refresh(providers: dict[str, BaseProvider]):
+    lock = try_lock("refresh.lock")
+    if lock is None:
+        logger.info("Another refresh is already running")
+        return
+    with lock:
+        candidates = get_candidates(providers)
+        if not candidates:
+            return
+        scheduler = get_schedule(candidates)
+        probe = start_probe(candidates, REFRESH_TIMEOUT)
+        try:
+            get_probe_result(probe, REFRESH_TIMEOUT, scheduler)
+        except TimeoutError:
+            logger.warning("Refresh timed out")
+            if scheduler is not None:
+                scheduler.connected = [p.NAME for p in probe.providers if p.connected]
+                scheduler.update(None)
+        store_schedule(scheduler)
+
+
+def run_broker(providers: dict[str, BaseProvider]):
+    try:
+        path = get_socket_path(sys.argv[1:])
+    except OSError:
+        logger.exception("Cannot serve other instances")
+        return
+    lock = try_lock(f"{os.path.basename(path)}.lock")
+    if lock is None:
+        logger.info("Another broker is already running")
+        return
+    with lock:
+        broker = Broker(path)
+        worker = threading.Thread(
+            target=run_daemon,
+            args=(providers, lambda output: broker.publish(format_output(output))),
+            daemon=True,
+        )
+        worker.start()
+        broker.serve(worker)
+
+
+def run_daemon(
+    providers: dict[str, BaseProvider],
+    emit: Callable[[dict], None] = print_output,
+):
+    watcher = None
+    if not args.no_watch and not args.no_conn_check:
+        watcher = get_connection_watcher()
+    try:
+        run_updates(providers, emit, watcher)
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+
+def run_updates(
+    providers: dict[str, BaseProvider],
+    emit: Callable[[dict], None],
+    watcher: ConnectionWatcher | None,
+):
+    """updates and emits the output forever, woken up by `watcher` if there is one"""
+    last_output = None
+    probe = None
+    scheduler = Scheduler(args.interval) if not args.fixed_interval else None
+    candidates: list[BaseProvider] = []
+    current: SavedStatus | None = None
+    stale = estimated = False
+    next_update = 0.0
+    while True:
+        if time.monotonic() >= next_update:
+            if probe is None:
+                # the set of connected networks may have changed since the last update
+                clear_connection_cache()
+                candidates = get_candidates(providers)
+                if scheduler is not None:
+                    scheduler.reset([p.NAME for p in candidates])
+                if candidates:
+                    # if the update times out, the probe continues in the background
+                    probe = start_probe(candidates, REFRESH_TIMEOUT)
+            current = None
+            stale = estimated = False
+            delay = args.interval
+            if probe is not None:
+                try:
+                    current = get_probe_result(probe, args.timeout, scheduler)
+                except TimeoutError:
+                    # the probe keeps running, wait for it again on the next update
+                    logger.warning("Update timed out")
+                    current = get_saved_status(probe.providers, args.max_stale)
+                    stale = True
+                else:
+                    if current is None:
+                        # connected, but the portal does not respond
+                        connected = [p for p in probe.providers if p.connected]
+                        current = get_offline_status(connected)
+                        estimated = True
+                    probe = None
+                    if scheduler is not None:
+                        delay = scheduler.get_delay()
+            next_update = time.monotonic() + delay
+        elif current is not None:
+            if estimated and time.time() - current.time > args.max_offline:
+                current = None
+            else:
+                # the next stop changes with time, no need to ask the provider for that
+                current = current._replace(status=advance_next_stop(current.status))
+        # an empty text hides the module
+        output = render(current, stale, estimated, advance=False) or {"text": ""}
+        if output != last_output:
+            emit(output)
+            last_output = output
+        timeout = max(min(next_update - time.monotonic(), RENDER_INTERVAL), 0)
+        if watcher is None:
+            time.sleep(timeout)
+        elif watcher.wait(timeout if candidates else None):
+            # update immediately, and nothing to do at all until then if not connected
+            logger.info("WiFi connection changed")
+            next_update = 0.0
+            try:
+                # checks that failed before may pass on the new connection
+                forget_misses()
+            except OSError:
+                logger.exception("Could not save probed providers")
+
+
+if args.dummy:
+    provider = PROVIDERS[args.dummy]()
+    output = get_output(provider.NAME, provider.get_dummy_status())
+    if output is not None:
+        print_output(output)
+else:
+    providers = {
+        # updates are scheduled for when the data changes, e.g. every few seconds
+        # when approaching a stop, so cached responses are always revalidated then
+        name: provider_class(
+            base_url=args.base_url, max_cache_age=None if args.fixed_interval else 0
+        )
+        for name, provider_class in PROVIDERS.items()
+    }
+    if args.refresh:
+        run_refresh(providers)
+    elif args.serve:
+        run_broker(providers)
+    elif args.daemon:
+        try:
+            run_daemon(providers)
+        except (KeyboardInterrupt, BrokenPipeError):
+            # Waybar closed the pipe or we were interrupted
+            pass
+    else:
+        run_once(providers)
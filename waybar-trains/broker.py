@@ -0,0 +1,153 @@
+"""
+sharing the output between several instances, e.g. of one bar per monitor
+
+only uses the standard library, so that clients start quickly
+"""
+
+import hashlib
+import os
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# options that select the role, and do not change the output
+ROLE_OPTIONS = ("--broker", "--serve")
+# seconds without any client after which the broker exits
+IDLE_TIMEOUT = 600
+# seconds a client waits for the output of the broker
+CLIENT_TIMEOUT = 5
+# seconds the broker waits for its first output before letting a client fetch itself
+READY_TIMEOUT = 3
+
+
+def get_options(argv: list[str]) -> list[str]:
+    return [arg for arg in argv if arg not in ROLE_OPTIONS]
+
+
+def get_socket_dir() -> str:
+    """
+    returns a directory that only the current user can access, so that no one else
+    can bind the socket, raises OSError if there is none
+    """
+    directory = os.environ.get("XDG_RUNTIME_DIR")
+    if directory:
+        return directory
+    directory = os.path.join(tempfile.gettempdir(), f"waybar-trains-{os.getuid()}")
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise PermissionError(f"{directory} is not a private directory")
+    return directory
+
+
+def get_socket_path(argv: list[str]) -> str:
+    """
+    returns the socket of the broker for the command line `argv`, instances with the
+    same options share one broker
+    raises OSError if there is no private directory for it
+    """
+    key = hashlib.sha1("\0".join(get_options(argv)).encode()).hexdigest()[:12]
+    return os.path.join(get_socket_dir(), f"waybar-trains-{os.getuid()}-{key}.sock")
+
+
+def run_client(package: str, argv: list[str]) -> bool:
+    """
+    prints the output of the broker for `argv` and returns True, else returns False
+    if the broker is not running, it is started for the next time
+    """
+    try:
+        path = get_socket_path(argv)
+    except OSError:
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(CLIENT_TIMEOUT)
+            client.connect(path)
+            output = b"".join(iter(lambda: client.recv(65536), b""))
+    except (FileNotFoundError, ConnectionRefusedError):
+        start_broker(package, argv)
+        return False
+    except OSError:
+        return False
+    if not output:
+        # the broker has no output yet
+        return False
+    sys.stdout.buffer.write(output)
+    sys.stdout.flush()
+    return True
+
+
+def start_broker(package: str, argv: list[str]):
+    """starts the broker in a separate process, which outlives this one"""
+    subprocess.Popen(
+        [sys.executable, "-m", package, "--serve", *get_options(argv)],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+class Broker:
+    """serves the latest output line to any number of clients over a Unix socket"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._output: bytes | None = None
+        self._ready = threading.Event()
+
+    def publish(self, line: str):
+        self._output = (line + "\n").encode()
+        self._ready.set()
+
+    def serve(self, worker: threading.Thread, idle_timeout: float = IDLE_TIMEOUT):
+        """
+        serves clients while `worker` is alive, until no client connected for
+        `idle_timeout` seconds
+        the caller has to make sure that no other broker uses the same path
+        """
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(self.path)
+            try:
+                os.chmod(self.path, 0o600)
+                server.listen()
+                last_request = time.monotonic()
+                while worker.is_alive():
+                    idle = time.monotonic() - last_request
+                    if idle >= idle_timeout:
+                        break
+                    server.settimeout(min(idle_timeout - idle, 5))
+                    try:
+                        connection, _ = server.accept()
+                    except TimeoutError:
+                        continue
+                    last_request = time.monotonic()
+                    threading.Thread(
+                        target=self._respond, args=(connection,), daemon=True
+                    ).start()
+            finally:
+                os.unlink(self.path)
+
+    def _respond(self, connection: socket.socket):
+        with connection:
+            if not self._ready.wait(READY_TIMEOUT):
+                return
+            try:
+                connection.sendall(self._output)  # type:ignore[reportArgumentType]
+            except OSError:
+                pass
@@ -1,6 +1,13 @@
+import threading
+import time
+from concurrent.futures import Future
+
 from .base import BaseProvider
+from .cache import read_json, write_json
 from .iceportal import IceportalProvider
 from .odeg import ODEGProvider
+from .types import Status
+from .utils import _get_connected_ssids, get_network_key, run_in_thread
 from .zugportal import ZugportalProvider
 
 PROVIDERS: dict[str, type[BaseProvider]] = {
@@ -11,3 +18,166 @@ PROVIDERS: dict[str, type[BaseProvider]] = {
         ODEGProvider,
     ]
 }
+
+
+def _index_ssids(providers: dict[str, type[BaseProvider]]) -> dict[str, list[str]]:
+    index: dict[str, list[str]] = {}
+    for name, provider in providers.items():
+        for ssid in provider.SSIDS:
+            index.setdefault(ssid, []).append(name)
+    return index
+
+
+PROVIDERS_BY_SSID = _index_ssids(PROVIDERS)
+
+# seconds for which a provider whose connection check failed is not probed again
+# while connected to the same network, unless the WiFi connection changes
+MISS_TTL = 120
+# number of networks for which the last provider with a status is remembered
+MAX_NETWORKS = 20
+
+
+def get_connected_providers() -> list[str]:
+    """
+    returns the names of the providers whose WiFi network is connected, in the order
+    of `PROVIDERS`, using a single scan of the connected networks
+    """
+    names = {
+        name
+        for ssid in _get_connected_ssids()
+        for name in PROVIDERS_BY_SSID.get(ssid, ())
+    }
+    if not names:
+        return []
+    return [name for name in PROVIDERS if name in names]
+
+
+def _read_history() -> dict[str, dict]:
+    history = read_json("providers.json")
+    return history if isinstance(history, dict) else {}
+
+
+def _parse_entry(entry: dict, now: float) -> tuple[str | None, dict[str, float]]:
+    """returns the last provider with a status and the recent misses of a network"""
+    try:
+        misses = {
+            name: miss
+            for name, miss in entry.get("misses", {}).items()
+            if now - miss < MISS_TTL
+        }
+        return entry.get("last"), misses
+    except (AttributeError, TypeError):
+        return None, {}
+
+
+def order_providers(
+    providers: list[BaseProvider], now: float | None = None
+) -> list[BaseProvider]:
+    """
+    returns `providers` with the one that last had a status on the connected network
+    first, without those whose connection check failed there in the last `MISS_TTL`
+    seconds
+    """
+    if now is None:
+        now = time.time()
+    last, misses = _parse_entry(_read_history().get(get_network_key(), {}), now)
+    ordered = [p for p in providers if p.NAME not in misses]
+    ordered.sort(key=lambda p: p.NAME != last)
+    return ordered
+
+
+def record_probe(
+    providers: list[BaseProvider],
+    provider: BaseProvider | None,
+    now: float | None = None,
+):
+    """
+    remembers `provider` as the one that had a status on the connected network, and
+    the `providers` whose connection check failed, but not those whose check was
+    inconclusive, e.g. because the network was still being set up
+    """
+    if now is None:
+        now = time.time()
+    network = get_network_key()
+    history = _read_history()
+    entry = history.pop(network, {})
+    last, misses = _parse_entry(entry, now)
+    for p in providers:
+        if p.connected is False:
+            misses[p.NAME] = now
+        elif p.connected:
+            misses.pop(p.NAME, None)
+    if provider is not None:
+        last = provider.NAME
+    if entry == {"last": last, "misses": misses}:
+        return
+    # the most recently updated network is last
+    history[network] = {"last": last, "misses": misses}
+    while len(history) > MAX_NETWORKS:
+        del history[next(iter(history))]
+    write_json("providers.json", history)
+
+
+def forget_misses():
+    """makes the next probes check all providers again, e.g. after joining a network"""
+    history = _read_history()
+    for entry in history.values():
+        if isinstance(entry, dict):
+            entry.pop("misses", None)
+    write_json("providers.json", history)
+
+
+# the last `get_status` of each provider, which keeps the state of a call on the
+# provider, so it is not probed again while an earlier probe still runs it
+_last_probes: dict[BaseProvider, Future[Status | None]] = {}
+
+
+class Probe:
+    """
+    runs `get_status` of several providers concurrently, each on its own daemon thread
+    providers that are still busy with an earlier probe are left out
+    """
+
+    def __init__(
+        self,
+        providers: list[BaseProvider],
+        conn_check=True,
+        login=False,
+        deadline: float | None = None,
+    ):
+        self.providers: list[BaseProvider] = []
+        self._cancel = threading.Event()
+        self._futures: list[Future[Status | None]] = []
+        for provider in providers:
+            previous = _last_probes.get(provider)
+            if previous is not None and not previous.done():
+                provider.logger.info("Skipping, still busy with an earlier update")
+                continue
+            future = run_in_thread(
+                provider.get_status,
+                conn_check,
+                login,
+                self._cancel,
+                deadline,
+                name=f"probe-{provider.NAME}",
+            )
+            _last_probes[provider] = future
+            self.providers.append(provider)
+            self._futures.append(future)
+
+    def result(
+        self, timeout: float | None = None
+    ) -> tuple[BaseProvider, Status] | tuple[None, None]:
+        """
+        returns the status of the first provider in `providers` that has one, cancelling
+        the probes that are still running
+        raises TimeoutError if that is not known after `timeout` seconds
+        """
+        end = time.monotonic() + timeout if timeout is not None else None
+        for provider, future in zip(self.providers, self._futures):
+            remaining = max(end - time.monotonic(), 0) if end is not None else None
+            status = future.result(remaining)
+            if status is not None:
+                self._cancel.set()
+                return provider, status
+        return None, None
@@ -2,34 +2,252 @@ import dataclasses
 import datetime
 import json
 import os.path
+import threading
+import time
 from abc import ABC, abstractmethod
-from logging import LoggerAdapter, getLogger
-from pprint import pformat
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from logging import DEBUG, LoggerAdapter, getLogger
 from types import NotImplementedType
-from typing import Any, Literal, NamedTuple
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Hashable,
+    Literal,
+    Mapping,
+    NamedTuple,
+)
+from urllib.parse import urlsplit
 
-import requests
+from .cache import CachedResponse, get_cache_dir, read_json, write_json
+from .fast_json import loads
+from .types import Status, Stop
+from .utils import (
+    estimate_next_stop,
+    get_session,
+    is_connected_to_ssid,
+    resolve_hostnames,
+    run_in_thread,
+    select_fields,
+)
 
-from .types import Status
-from .utils import estimate_next_stop
+if TYPE_CHECKING:
+    import requests
 
 _logger = getLogger("waybar-trains")
+# fetched data is only dumped to this logger, as formatting it is expensive
+_payload_logger = getLogger("waybar-trains.payload")
 
 
 class BaseProvider(ABC):
     NAME: str = NotImplemented
+    SSIDS: frozenset[str] = frozenset()
+    """names of the WiFi networks this provider's portal is available on"""
+    LOCAL_HOSTS: dict[str, str] = {}
+    """
+    hosts which must resolve to an address starting with the given prefix when connected
+    to the train's network, to tell it apart from other networks with the same name
+    """
 
-    def __init__(self, session: requests.Session | None = None):
+    LOGIN_CHECK_INTERVAL: float = 120
+    """seconds between checks whether a remembered login is still valid"""
+    LOGIN_EXPIRY: float = 3600
+    """seconds after which a remembered login is not trusted anymore"""
+
+    PHASE_TIMEOUTS: dict[str, float] = {
+        "conn_check": 3,
+        "login": 5,
+        "fetch": 5,
+        "parse": 1,
+    }
+    """maximum seconds spent in each phase of `get_status`"""
+
+    def __init__(
+        self,
+        session: "requests.Session | None" = None,
+        base_url: str | None = None,
+        max_cache_age: float | None = None,
+    ):
+        """
+        if `base_url` is given, requests to https://<host>/<path> are sent to
+        <base_url>/<host>/<path> instead, e.g. to test against a local server
+        `max_cache_age` caps the TTLs of cached responses, e.g. to 0 if the time of
+        updates is already chosen by how fresh the data has to be
+        """
         super().__init__()
-        if session is None:
-            session = requests.Session()
-        self._session = session
+        self.__session = session
+        self.base_url = base_url
+        self.max_cache_age = max_cache_age
         self.logger = ProviderLoggingAdapter(_logger, {"name": self.NAME})
+        self.payload_logger = ProviderLoggingAdapter(
+            _payload_logger, {"name": self.NAME}
+        )
+        self._stop_cache: dict[Hashable, Stop] = {}
+        self._deadline: float | None = None
+        self._phase_deadline: float | None = None
+        self.timings: dict[str, float] = {}
+        """seconds spent in each phase of the last `get_status`, and in total"""
+        self.connected: bool | None = None
+        """
+        if the connection check of the last `get_status` passed or was skipped, None
+        while it has not finished or if it was inconclusive, see `_is_connected`
+        """
+
+    @property
+    def _session(self) -> "requests.Session":
+        # created on first use, so that requests is only imported when actually
+        # connected to a train network
+        if self.__session is None:
+            self.__session = get_session()
+        return self.__session
 
-    def _is_connected(self) -> bool:
-        """heuristic to check if connected to WiFi"""
+    def _is_connected(self) -> bool | None:
+        """
+        heuristic to check if connected to WiFi, returns None instead of False if that
+        may change soon, e.g. while the network is still being set up after joining it
+        """
+        if self.SSIDS and not is_connected_to_ssid(self.SSIDS):
+            return None
+        if self.LOCAL_HOSTS:
+            # idea from https://github.com/liclac/ambient/blob/75e1d3aee4c1c5ba55d95cf9e14e39afb24879b1/functions.d/ambient_resolve4.fish
+            addresses = resolve_hostnames(self.LOCAL_HOSTS, self._timeout())
+            for host, prefix in self.LOCAL_HOSTS.items():
+                address = addresses[host]
+                if address is None:
+                    self.logger.debug(f"{host} does not resolve")
+                    return None
+                if not address.startswith(prefix):
+                    self.logger.debug(f"{host} resolves to {address}, not {prefix}*")
+                    return False
         return True
 
+    def _url(self, url: str) -> str:
+        """returns the URL to use for a request to `url`, respecting `base_url`"""
+        if self.base_url is None:
+            return url
+        parts = urlsplit(url)
+        query = f"?{parts.query}" if parts.query else ""
+        return f"{self.base_url.rstrip('/')}/{parts.netloc}{parts.path}{query}"
+
+    def _get_json(
+        self,
+        url: str,
+        ttl: float = 0,
+        fields: Mapping[str, Mapping | None] | None = None,
+    ) -> Any:
+        """
+        GETs JSON from `url`, reusing the cached response for `ttl` seconds and
+        revalidating it with a conditional request afterwards
+        if `fields` is given, only these fields are kept and cached, see `select_fields`
+        """
+        if self.payload_logger.isEnabledFor(DEBUG):
+            # dumped payloads are complete, e.g. to be used as dummy data
+            fields = None
+        if self.max_cache_age is not None:
+            ttl = min(ttl, self.max_cache_age)
+        url = self._url(url)
+        cached = CachedResponse(url, json.dumps(fields) if fields is not None else None)
+        if cached.is_fresh(ttl):
+            self.logger.debug(f"Using cached response for {url}")
+            return cached.body
+        response = self._session.get(
+            url, headers=cached.get_validators(), timeout=self._timeout()
+        )
+        if response.status_code == 304 and cached.body is not None:
+            self.logger.debug(f"Cached response for {url} has not been modified")
+            body = cached.body
+        else:
+            response.raise_for_status()
+            body = loads(response.content)
+            if fields is not None:
+                body = select_fields(body, fields)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if ttl or etag or last_modified:
+            try:
+                cached.store(body, etag, last_modified)
+            except OSError:
+                self.logger.exception(f"Could not cache response for {url}")
+        return body
+
+    def _get_json_in_thread(
+        self,
+        url: str,
+        ttl: float = 0,
+        fields: Mapping[str, Mapping | None] | None = None,
+    ) -> Future[Any]:
+        """
+        `_get_json` on a daemon thread, so that independent requests are sent
+        concurrently, wait for it with `_wait`
+        """
+        return run_in_thread(
+            self._get_json, url, ttl, fields, name=f"{self.NAME}-request"
+        )
+
+    def _wait[T](self, future: Future[T]) -> T:
+        """
+        returns the result of `future`, raises `DeadlineExceeded` if it is not done
+        when the current phase times out
+        """
+        try:
+            return future.result(self._timeout())
+        except FutureTimeoutError:
+            raise DeadlineExceeded("Deadline exceeded while waiting for a request")
+
+    @contextmanager
+    def _phase(self, name: str):
+        """
+        limits the time of requests in this phase of `get_status` using `_timeout`
+        raises `DeadlineExceeded` if the overall deadline has already passed
+        """
+        start = time.monotonic()
+        if self._deadline is not None and start >= self._deadline:
+            raise DeadlineExceeded(f"Deadline exceeded before {name}")
+        budget = self.PHASE_TIMEOUTS.get(name)
+        phase_deadline = self._deadline
+        if budget is not None:
+            phase_deadline = min(phase_deadline or start + budget, start + budget)
+        self._phase_deadline = phase_deadline
+        try:
+            yield
+        finally:
+            self._phase_deadline = None
+            duration = time.monotonic() - start
+            self.timings[name] = duration
+            if budget is not None and duration > budget:
+                self.logger.warning(f"{name} took {duration:.2f}s (budget {budget}s)")
+
+    def _timeout(self) -> float | None:
+        """timeout to use for a request in the current phase"""
+        if self._phase_deadline is None:
+            return None
+        return max(self._phase_deadline - time.monotonic(), 0.1)
+
+    def _parse_stops(
+        self,
+        raw_stops: list[dict],
+        key: Callable[[dict], Hashable],
+        parse: Callable[[Any], Stop],
+    ) -> list[Stop]:
+        """
+        returns `parse(key(raw_stop))` for each stop, reusing the stops (and their
+        formatted strings) from the previous call whose key has not changed
+        `key` should extract all values of a stop that `parse` uses
+        """
+        previous = self._stop_cache
+        self._stop_cache = {}
+        stops = []
+        for raw_stop in raw_stops:
+            stop_key = key(raw_stop)
+            stop = previous.get(stop_key)
+            if stop is None:
+                stop = parse(stop_key)
+            self._stop_cache[stop_key] = stop
+            stops.append(stop)
+        return stops
+
     def _read_dummy_data(self, filepath):
         with open(
             os.path.join(os.path.dirname(__file__), "_dummy_data", filepath)
@@ -45,6 +263,14 @@ class BaseProvider(ABC):
     @abstractmethod
     def _get_status_from_data(self, data: Any) -> Status | None: ...
 
+    def _login(self) -> None | NotImplementedType:
+        """logs in to the WiFi network"""
+        return NotImplemented
+
+    def _is_logged_in(self) -> bool | NotImplementedType:
+        """checks if logged in to the WiFi network"""
+        return NotImplemented
+
     def attempt_login(
         self,
     ) -> (
@@ -53,22 +279,91 @@ class BaseProvider(ABC):
         | Literal["error"]
         | NotImplementedType
     ):
-        return NotImplemented
+        """
+        logs in, unless a previous login (possibly by another invocation) is remembered
+        a remembered login is checked every `LOGIN_CHECK_INTERVAL` seconds and trusted
+        for at most `LOGIN_EXPIRY` seconds
+        """
+        if type(self)._login is BaseProvider._login:
+            return NotImplemented
+        now = time.time()
+        state = read_json(self._login_state_name)
+        if state is not None and now < state["expires_at"]:
+            if now - state["checked_at"] < self.LOGIN_CHECK_INTERVAL:
+                return "already_logged_in"
+            # a login that cannot be checked is trusted until it expires
+            if self._is_logged_in() is not False:
+                self._save_login_state({**state, "checked_at": now})
+                return "already_logged_in"
+            self.logger.info("Remembered login is not valid anymore")
+        self._login()
+        if self._is_logged_in() is False:
+            self.forget_login()
+            return "error"
+        self._save_login_state(
+            {
+                "logged_in_at": now,
+                "checked_at": now,
+                "expires_at": now + self.LOGIN_EXPIRY,
+            }
+        )
+        return "success"
 
-    def get_status(self, conn_check=True, login=False) -> Status | None:
+    def forget_login(self):
+        """makes the next `attempt_login` log in again"""
+        try:
+            os.unlink(os.path.join(get_cache_dir(), self._login_state_name))
+        except FileNotFoundError:
+            pass
+
+    @property
+    def _login_state_name(self):
+        return f"login-{self.NAME}.json"
+
+    def _save_login_state(self, state: dict):
+        try:
+            write_json(self._login_state_name, state)
+        except OSError:
+            self.logger.exception("Could not save login state")
+
+    def get_status(
+        self,
+        conn_check=True,
+        login=False,
+        cancel: threading.Event | None = None,
+        deadline: float | None = None,
+    ) -> Status | None:
         """
         tries to fetch provider data, and if successful returns a status string, else None
         if both `conn_check` and `login` are True, also tries to log in automatically
+        if `cancel` is set while running, gives up before the next network request
+        if `deadline` (in `time.monotonic()` seconds) passes, gives up before the next
+        phase, and requests time out at the latest at the deadline
         """
+        self._deadline = deadline
+        self.timings = {}
+        self.connected = None
+        start = time.monotonic()
         try:
             self.logger.info(f"Getting status")
             if conn_check:
-                if not self._is_connected():
+                with self._phase("conn_check"):
+                    self.connected = self._is_connected()
+                if not self.connected:
                     self.logger.debug("Skipping, not connected to WiFi")
                     return None
+                if cancel is not None and cancel.is_set():
+                    self.logger.debug("Cancelled after connection check")
+                    return None
+            self.connected = True
+            res = None
+            if conn_check and login:
                 res = "error"
                 try:
-                    res = self.attempt_login()
+                    with self._phase("login"):
+                        res = self.attempt_login()
+                except DeadlineExceeded:
+                    raise
                 except:
                     self.logger.exception("Automatic login failed")
                 finally:
@@ -80,17 +375,37 @@ class BaseProvider(ABC):
                         self.logger.debug("Already logged in")
                     else:
                         self.logger.warn("Automatic login failed")
-            data = self._fetch_data()
-            self.logger.debug(f"Got data {pformat(data)}")
-            status = self._get_status_from_data(data)
+            if cancel is not None and cancel.is_set():
+                self.logger.debug("Cancelled before fetching data")
+                return None
+            try:
+                with self._phase("fetch"):
+                    data = self._fetch_data()
+            except:
+                if res == "already_logged_in":
+                    # the remembered login might be the reason, e.g. on another train
+                    self.forget_login()
+                raise
+            if self.payload_logger.isEnabledFor(DEBUG):
+                self.payload_logger.debug("%s", LazyJSON(data))
+            with self._phase("parse"):
+                status = self._get_status_from_data(data)
             if status is not None and not status.next_stop and status.stops:
-                status = dataclasses.replace(
-                    status,
-                    next_stop=estimate_next_stop(status.stops),
-                )
+                with self._phase("next_stop"):
+                    status = dataclasses.replace(
+                        status,
+                        next_stop=estimate_next_stop(
+                            status.stops, departures=status.departures
+                        ),
+                    )
             return status
+        except DeadlineExceeded as e:
+            self.logger.warning(str(e))
         except:
             self.logger.exception("Unhandled exception while retrieving status")
+        finally:
+            self._deadline = None
+            self.timings["total"] = time.monotonic() - start
 
     def get_dummy_status(self) -> Status | None:
         data, time = self._get_dummy_data()
@@ -99,16 +414,33 @@ class BaseProvider(ABC):
         if status is not None and not status.next_stop and status.stops:
             status = dataclasses.replace(
                 status,
-                next_stop=estimate_next_stop(status.stops, time),
+                next_stop=estimate_next_stop(status.stops, time, status.departures),
             )
         return status
 
 
+class DeadlineExceeded(Exception):
+    pass
+
+
 class DummyProviderData[T](NamedTuple):
     data: T
     time: datetime.datetime
 
 
+class LazyJSON:
+    """formats `data` as JSON only when converted to a string"""
+
+    def __init__(self, data: Any):
+        self.data = data
+
+    def __str__(self):
+        data = self.data
+        if isinstance(data, tuple) and hasattr(data, "_asdict"):
+            data = data._asdict()  # type:ignore[reportAttributeAccessIssue]
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
 class ProviderLoggingAdapter(LoggerAdapter):
     def process(self, msg, kwargs):
         name = self.extra["name"]  # type:ignore[reportOptionalSubscript]
@@ -0,0 +1,128 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import IO, Any, NamedTuple
+
+from .fast_json import loads
+from .types import Status
+
+
+def get_cache_dir() -> str:
+    return os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "waybar-trains",
+    )
+
+
+def read_json(name: str) -> Any | None:
+    """returns the contents of cache file `name`, or None if it is missing or broken"""
+    try:
+        with open(os.path.join(get_cache_dir(), name), "rb") as f:
+            return loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(name: str, data: Any):
+    path = os.path.join(get_cache_dir(), name)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # several instances might run at the same time, so replace the file atomically
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def try_lock(name: str) -> IO | None:
+    """
+    returns the opened lock file `name` if it could be locked exclusively, else None
+    the lock is held until the file is closed
+    """
+    path = os.path.join(get_cache_dir(), name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = open(path, "w")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+class SavedStatus(NamedTuple):
+    provider: str
+    status: Status
+    time: float
+
+
+def save_status(provider: str, status: Status):
+    """remembers `status` as the last status that was fetched successfully"""
+    write_json(
+        "status.json",
+        {"provider": provider, "time": time.time(), "status": status.to_json()},
+    )
+
+
+def load_status(max_age: float) -> SavedStatus | None:
+    """returns the last successfully fetched status if it is at most `max_age` old"""
+    data = read_json("status.json")
+    if data is None:
+        return None
+    try:
+        if time.time() - data["time"] > max_age:
+            return None
+        return SavedStatus(
+            data["provider"], Status.from_json(data["status"]), data["time"]
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class CachedResponse:
+    """
+    a JSON response stored on disk, together with its validators
+    `variant` distinguishes different selections of fields from the same response
+    """
+
+    def __init__(self, url: str, variant: str | None = None):
+        self.url = url
+        key = url if variant is None else f"{url}\0{variant}"
+        self._name = os.path.join(
+            "http", hashlib.sha1(key.encode()).hexdigest() + ".json"
+        )
+        self._entry: dict | None = read_json(self._name)
+
+    @property
+    def body(self) -> Any | None:
+        return self._entry["body"] if self._entry is not None else None
+
+    def is_fresh(self, ttl: float) -> bool:
+        return self._entry is not None and time.time() - self._entry["time"] < ttl
+
+    def get_validators(self) -> dict[str, str]:
+        """returns headers for a conditional request"""
+        headers = {}
+        if self._entry is not None:
+            if etag := self._entry.get("etag"):
+                headers["If-None-Match"] = etag
+            if last_modified := self._entry.get("last_modified"):
+                headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def store(self, body: Any, etag: str | None, last_modified: str | None):
+        self._entry = {
+            "url": self.url,
+            "time": time.time(),
+            "etag": etag,
+            "last_modified": last_modified,
+            "body": body,
+        }
+        write_json(self._name, self._entry)
@@ -0,0 +1,15 @@
+import json
+from typing import Any
+
+try:
+    # optional, decodes several times faster than the standard library
+    import orjson  # type:ignore[reportMissingImports]
+except ImportError:
+    orjson = None
+
+
+def loads(data: bytes | str) -> Any:
+    """decodes JSON using orjson if it is installed, raises ValueError if invalid"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -1,10 +1,8 @@
 from datetime import datetime
-from typing import Literal, NamedTuple
-from zoneinfo import ZoneInfo
+from typing import NamedTuple
 
 from .base import BaseProvider, DummyProviderData
 from .types import DelayedTime, Status, Stop
-from .utils import is_connected_to_ssid, resolve_hostname
 
 
 class IceportalData(NamedTuple):
@@ -14,23 +12,48 @@ class IceportalData(NamedTuple):
 
 class IceportalProvider(BaseProvider):
     NAME = "iceportal"
+    SSIDS = frozenset({"WIFIonICE"})
+    # check if iceportal.de with local ip address is really available
+    LOCAL_HOSTS = {"iceportal.de": "172."}
 
-    def _is_connected(self) -> bool:
-        return (
-            is_connected_to_ssid({"WIFIonICE"})
-            and
-            # check if iceportal.de with local ip address is really available
-            # idea from https://github.com/liclac/ambient/blob/75e1d3aee4c1c5ba55d95cf9e14e39afb24879b1/functions.d/ambient_resolve4.fish
-            resolve_hostname("iceportal.de").startswith("172.")
-        )
+    # the trip with all of its stops rarely changes, but the speed in the status does
+    TRIP_TTL = 60
+    STATUS_TTL = 0
+
+    # the parts of the trip that are used, see `select_fields`
+    TRIP_FIELDS = {
+        "trip": {
+            "vzn": None,
+            "trainType": None,
+            "stopInfo": {"actualNext": None, "finalStationName": None},
+            "stops": {
+                "station": {"name": None, "evaNr": None},
+                "timetable": {
+                    "scheduledArrivalTime": None,
+                    "actualArrivalTime": None,
+                    "scheduledDepartureTime": None,
+                    "actualDepartureTime": None,
+                },
+                "track": {"actual": None},
+            },
+        }
+    }
 
     def _fetch_data(self) -> IceportalData:
-        return IceportalData(
-            trip=self._session.get("https://iceportal.de/api1/rs/tripInfo/trip").json(),
-            status=self._session.get("https://iceportal.de/api1/rs/status").json(),
+        # the trip and the status are independent, so they are fetched concurrently
+        trip = self._get_json_in_thread(
+            "https://iceportal.de/api1/rs/tripInfo/trip",
+            ttl=self.TRIP_TTL,
+            fields=self.TRIP_FIELDS,
+        )
+        status = self._get_json(
+            "https://iceportal.de/api1/rs/status", ttl=self.STATUS_TTL
         )
+        return IceportalData(trip=self._wait(trip), status=status)
 
     def _get_dummy_data(self) -> DummyProviderData[IceportalData]:
+        from zoneinfo import ZoneInfo
+
         return DummyProviderData(
             IceportalData(
                 self._read_dummy_data("2021-08-31T12-02-55-ice1601/trip.json"),
@@ -40,27 +63,33 @@ class IceportalProvider(BaseProvider):
         )
 
     def _get_status_from_data(self, data: IceportalData) -> Status | None:
-        def json_to_stop(stop: dict):
+        def stop_key(stop: dict):
             station = stop["station"]
             timetable = stop["timetable"]
+            return (
+                station["name"],
+                station["evaNr"],
+                timetable["scheduledArrivalTime"],
+                timetable["actualArrivalTime"],
+                timetable["scheduledDepartureTime"],
+                timetable["actualDepartureTime"],
+                stop.get("track", {}).get("actual"),
+            )
+
+        def key_to_stop(key: tuple):
+            name, id, arrival, actual_arrival, departure, actual_departure, track = key
             return Stop(
-                name=station["name"],
-                id=station["evaNr"],
-                arrival=DelayedTime.from_timestamps_ms(
-                    timetable["scheduledArrivalTime"],
-                    timetable["actualArrivalTime"],
-                ),
-                departure=DelayedTime.from_timestamps_ms(
-                    timetable["scheduledDepartureTime"],
-                    timetable["actualDepartureTime"],
-                ),
-                track=stop.get("track", {}).get("actual"),
+                name=name,
+                id=id,
+                arrival=DelayedTime.from_timestamps_ms(arrival, actual_arrival),
+                departure=DelayedTime.from_timestamps_ms(departure, actual_departure),
+                track=track,
             )
 
         trip = data.trip["trip"]
         status = data.status
 
-        stops = [json_to_stop(stop) for stop in trip["stops"]]
+        stops = self._parse_stops(trip["stops"], stop_key, key_to_stop)
 
         if (next_stop_id := trip["stopInfo"]["actualNext"]) != "":
             next_stop = next(stop for stop in stops if stop.id == next_stop_id)
@@ -80,11 +109,18 @@ class IceportalProvider(BaseProvider):
             next_stop=next_stop,
         )
 
-    def attempt_login(
-        self,
-    ) -> Literal["success"] | Literal["already_logged_in"] | Literal["error"]:
-        r = self._session.post("https://login.wifionice.de/cna/logon", {})
+    def _login(self):
+        r = self._session.post(
+            self._url("https://login.wifionice.de/cna/logon"),
+            {},
+            timeout=self._timeout(),
+        )
         r.raise_for_status()
-        r = self._session.get("https://login.wifionice.de/cna/health/venue")
+
+    def _is_logged_in(self) -> bool:
+        r = self._session.get(
+            self._url("https://login.wifionice.de/cna/health/venue"),
+            timeout=self._timeout(),
+        )
         r.raise_for_status()
-        return "success" if r.json()["result"]["healthy"] else "error"
+        return r.json()["result"]["healthy"]
@@ -0,0 +1,47 @@
+import json
+import os
+import time
+
+
+def format_timings(provider: str, timings: dict[str, float]) -> str:
+    phases = ", ".join(
+        f"{phase} {seconds * 1000:.1f}ms"
+        for phase, seconds in timings.items()
+        if phase != "total"
+    )
+    total = timings.get("total")
+    # the total is missing while the update is still running
+    total = f"{total * 1000:.1f}ms" if total is not None else "unfinished"
+    return f"{provider}: {total} ({phases})"
+
+
+def write_metrics(path: str, timings: dict[str, dict[str, float]]):
+    """
+    writes the timings of each provider to `path`
+    if `path` ends with .prom, it is replaced with a file for the textfile collector of
+    the Prometheus node exporter, else a JSON line is appended
+    """
+    if path.endswith(".prom"):
+        lines = [
+            "# HELP waybar_trains_phase_seconds Duration of the phases of the last update",
+            "# TYPE waybar_trains_phase_seconds gauge",
+        ]
+        for provider, phases in timings.items():
+            for phase, seconds in phases.items():
+                lines.append(
+                    f'waybar_trains_phase_seconds{{provider="{provider}",'
+                    f'phase="{phase}"}} {seconds:.6f}'
+                )
+        lines += [
+            "# HELP waybar_trains_last_update_timestamp_seconds Time of the last update",
+            "# TYPE waybar_trains_last_update_timestamp_seconds gauge",
+            f"waybar_trains_last_update_timestamp_seconds {time.time():.3f}",
+        ]
+        # the collector must never see a partially written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+    else:
+        with open(path, "a") as f:
+            f.write(json.dumps({"time": time.time(), "timings": timings}) + "\n")
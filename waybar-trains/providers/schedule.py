@@ -0,0 +1,148 @@
+import time
+
+from .cache import read_json, write_json
+from .types import Status
+
+# seconds before the arrival at the next stop in which updates are most frequent,
+# because tracks and delays are changed then
+APPROACH_TIME = 180
+# fraction of the time until the approach of the next stop to wait between updates
+APPROACH_FRACTION = 0.25
+# maximum seconds between updates while the next stop is far away
+MAX_INTERVAL = 120
+# maximum seconds between updates after failures
+MAX_BACKOFF = 300
+# speed in km/h below which a train away from a stop is considered to be held up
+STANDING_SPEED = 5
+
+
+class Scheduler:
+    """
+    picks the time of the next update from the state of the trip
+
+    `interval` is the time between updates when nothing is known about the trip.
+    updates are more frequent when approaching a stop, less frequent when the next stop
+    is far away and nothing changes, and back off exponentially on failures
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        providers: list[str] | None = None,
+        failures: int = 0,
+        fingerprint: str | None = None,
+        next_update: float = 0,
+        connected: list[str] | None = None,
+    ):
+        self.interval = interval
+        self.providers = providers or []
+        """names of the providers whose updates are scheduled"""
+        self.failures = failures
+        self.fingerprint = fingerprint
+        """rendered stops of the last status, to notice changes"""
+        self.next_update = next_update
+        """epoch seconds"""
+        self.connected = connected or []
+        """names of the providers whose connection check passed in the last update"""
+
+    @classmethod
+    def from_json(cls, interval: float, data: dict):
+        return cls(
+            interval,
+            providers=data["providers"],
+            failures=data["failures"],
+            fingerprint=data["fingerprint"],
+            next_update=data["next_update"],
+            connected=data["connected"],
+        )
+
+    def to_json(self) -> dict:
+        return {
+            "providers": self.providers,
+            "failures": self.failures,
+            "fingerprint": self.fingerprint,
+            "next_update": self.next_update,
+            "connected": self.connected,
+        }
+
+    def is_due(self, now: float | None = None) -> bool:
+        return (now if now is not None else time.time()) >= self.next_update
+
+    def get_delay(self, now: float | None = None) -> float:
+        """returns the seconds until the next update"""
+        return max(self.next_update - (now if now is not None else time.time()), 0)
+
+    def reset(self, providers: list[str]):
+        """forgets the state of another set of providers"""
+        if providers != self.providers:
+            self.providers = providers
+            self.failures = 0
+            self.fingerprint = None
+            self.next_update = 0
+            self.connected = []
+
+    def update(self, status: Status | None, now: float | None = None) -> float:
+        """
+        schedules the next update after an update that returned `status`, or failed if
+        it is None, and returns the seconds until then
+        """
+        if now is None:
+            now = time.time()
+        if status is None:
+            self.failures += 1
+            interval = min(self.interval * 2**self.failures, MAX_BACKOFF)
+        else:
+            self.failures = 0
+            fingerprint = status.get_tooltip()
+            changed = fingerprint != self.fingerprint
+            self.fingerprint = fingerprint
+            interval = self._get_interval(status, changed, now)
+        self.next_update = now + interval
+        return interval
+
+    def _get_interval(self, status: Status, changed: bool, now: float) -> float:
+        approach_interval = max(self.interval / 3, 1)
+        stop = status.next_stop
+        arrival = stop and (stop.arrival or stop.departure)
+        if arrival is None:
+            return self.interval
+        until_approach = arrival.real_timestamp - now - APPROACH_TIME
+        if until_approach <= 0:
+            # approaching or standing at the next stop
+            return approach_interval
+        interval = min(
+            max(until_approach * APPROACH_FRACTION, self.interval),
+            max(MAX_INTERVAL, self.interval),
+            # update again when the approach starts
+            max(until_approach, approach_interval),
+        )
+        if changed or _is_held_up(status):
+            # delays are changing
+            interval = min(interval, self.interval)
+        return interval
+
+
+def _is_held_up(status: Status) -> bool:
+    try:
+        return status.speed is not None and float(status.speed) < STANDING_SPEED
+    except ValueError:
+        return False
+
+
+def load_schedule(interval: float, providers: list[str]) -> Scheduler:
+    """returns the saved schedule of `providers`, or a new one"""
+    scheduler = Scheduler(interval, providers)
+    data = read_json("schedule.json")
+    if data is not None:
+        try:
+            saved = Scheduler.from_json(interval, data)
+        except (KeyError, TypeError):
+            pass
+        else:
+            if saved.providers == providers:
+                scheduler = saved
+    return scheduler
+
+
+def save_schedule(scheduler: Scheduler):
+    write_json("schedule.json", scheduler.to_json())
@@ -1,11 +1,14 @@
-from dataclasses import dataclass, field
+import math
+import time
+from dataclasses import dataclass, field, fields
 from datetime import datetime, timedelta, timezone
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DelayedTime:
-    planned: datetime
-    delay: timedelta
+    # epoch seconds and seconds, datetimes are only created when needed
+    planned_timestamp: int
+    delay_seconds: int
 
     @classmethod
     def from_iso(cls, planned: str | None, delay: int | None):
@@ -13,8 +16,8 @@ class DelayedTime:
         if planned is None:
             return None
         return cls(
-            planned=datetime.fromisoformat(planned),
-            delay=timedelta(minutes=delay or 0),
+            int(datetime.fromisoformat(planned).timestamp()),
+            (delay or 0) * 60,
         )
 
     @classmethod
@@ -23,12 +26,7 @@ class DelayedTime:
             return None
         if real is None:
             real = planned
-        planned_time = datetime.fromtimestamp(planned, tz=timezone.utc)
-        real_time = datetime.fromtimestamp(real, tz=timezone.utc)
-        return cls(
-            planned=planned_time,
-            delay=real_time - planned_time,
-        )
+        return cls(int(planned), int(real - planned))
 
     @classmethod
     def from_timestamps_ms(cls, planned: int | None, real: int | None):
@@ -37,20 +35,37 @@ class DelayedTime:
             real // 1000 if real is not None else real,
         )
 
+    @classmethod
+    def from_json(cls, data: dict):
+        return cls(int(data["planned"]), int(data["delay"]))
+
+    def to_json(self) -> dict:
+        return {"planned": self.planned_timestamp, "delay": self.delay_seconds}
+
+    @property
+    def real_timestamp(self) -> int:
+        return self.planned_timestamp + self.delay_seconds
+
+    @property
+    def planned(self):
+        return datetime.fromtimestamp(self.planned_timestamp, tz=timezone.utc)
+
+    @property
+    def delay(self):
+        return timedelta(seconds=self.delay_seconds)
+
     @property
     def real(self):
-        return self.planned + self.delay
+        return datetime.fromtimestamp(self.real_timestamp, tz=timezone.utc)
 
     def __str__(self):
-        time = self.real.astimezone().strftime("%H:%M")
-        if self.delay:
-            return (
-                f"{time} <sup>{int(round(self.delay / timedelta(minutes=1))):+}</sup>"
-            )
+        time = datetime.fromtimestamp(self.real_timestamp).strftime("%H:%M")
+        if self.delay_seconds:
+            return f"{time} <sup>{round(self.delay_seconds / 60):+}</sup>"
         return f"{time}"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Stop:
     name: str
     id: str | None = None
@@ -58,10 +73,37 @@ class Stop:
     departure: DelayedTime | None = None
     track: str | None = None
 
+    # formatted string, stops are immutable and often reused between updates
+    _text: str | None = field(default=None, init=False, repr=False, compare=False)
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return cls(
+            name=data["name"],
+            id=data["id"],
+            arrival=_delayed_time_from_json(data["arrival"]),
+            departure=_delayed_time_from_json(data["departure"]),
+            track=data["track"],
+        )
+
+    def to_json(self) -> dict:
+        return {
+            "name": self.name,
+            "id": self.id,
+            "arrival": self.arrival.to_json() if self.arrival else None,
+            "departure": self.departure.to_json() if self.departure else None,
+            "track": self.track,
+        }
+
     def estimated_departure(self):
         return self.departure or self.arrival or None
 
-    def __str__(self):
+    def __str__(self) -> str:
+        if self._text is None:
+            object.__setattr__(self, "_text", self._format())
+        return self._text  # type:ignore[reportReturnType]
+
+    def _format(self):
         if self.arrival and self.departure and self.arrival != self.departure:
             time = f"{self.arrival} – {self.departure}"
         elif time_value := self.arrival or self.departure:
@@ -85,7 +127,86 @@ class Status:
     next_stop: Stop | None = None
     stops: list[Stop] = field(default_factory=list)
 
-    def get_text(self):
+    # derived from `stops` and `next_stop`, see `departure_index`
+    departures: list[int] = field(init=False, repr=False, compare=False)
+    next_stop_index: int | None = field(init=False, repr=False, compare=False)
+
+    # rendered strings, like `Stop._text`, the text together with its countdown
+    _text: tuple[int | None, str] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _tooltip: str | None = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "departures", departure_index(self.stops))
+        index = None
+        if self.next_stop is not None:
+            # providers take the next stop from `stops`, so identity is enough
+            index = next(
+                (i for i, stop in enumerate(self.stops) if stop is self.next_stop),
+                None,
+            )
+            if index is None:
+                index = next(
+                    (i for i, stop in enumerate(self.stops) if stop == self.next_stop),
+                    None,
+                )
+        object.__setattr__(self, "next_stop_index", index)
+
+    @classmethod
+    def from_json(cls, data: dict):
+        stops = [Stop.from_json(stop) for stop in data["stops"]]
+        next_stop = data["next_stop"]
+        if next_stop is not None:
+            next_stop = Stop.from_json(next_stop)
+            # use the instance from `stops`
+            next_stop = next((stop for stop in stops if stop == next_stop), next_stop)
+        return cls(
+            **{
+                f.name: data[f.name]
+                for f in fields(cls)
+                if f.init and f.name not in ("next_stop", "stops")
+            },
+            next_stop=next_stop,
+            stops=stops,
+        )
+
+    def to_json(self) -> dict:
+        return {
+            **{
+                f.name: getattr(self, f.name)
+                for f in fields(self)
+                if f.init and f.name not in ("next_stop", "stops")
+            },
+            "next_stop": self.next_stop.to_json() if self.next_stop else None,
+            "stops": [stop.to_json() for stop in self.stops],
+        }
+
+    def get_text(self, countdown=False) -> str:
+        """`countdown` adds the minutes until the arrival at the next stop"""
+        minutes = self.get_minutes_to_next_stop() if countdown else None
+        if self._text is None or self._text[0] != minutes:
+            object.__setattr__(self, "_text", (minutes, self._format_text(minutes)))
+        return self._text[1]  # type:ignore[reportOptionalSubscript]
+
+    def get_tooltip(self) -> str:
+        if self._tooltip is None:
+            object.__setattr__(self, "_tooltip", self._format_tooltip())
+        return self._tooltip  # type:ignore[reportReturnType]
+
+    def get_minutes_to_next_stop(self, now: float | None = None) -> int | None:
+        """returns None if there is no next stop or the train has already arrived"""
+        if self.next_stop is None:
+            return None
+        arrival = self.next_stop.arrival or self.next_stop.departure
+        if arrival is None:
+            return None
+        seconds = arrival.real_timestamp - (now if now is not None else time.time())
+        if seconds <= 0:
+            return None
+        return math.ceil(seconds / 60)
+
+    def _format_text(self, minutes: int | None = None):
         if self.line:
             res = f"󰔬 {self.line} "
         elif self.vehicle and self.line_id:
@@ -97,6 +218,8 @@ class Status:
 
         if self.next_stop:
             res += f"  {self.next_stop} "
+            if minutes is not None:
+                res += f"(in {minutes} min) "
         elif self.destination:
             res += f"→ {self.destination} "
 
@@ -105,13 +228,28 @@ class Status:
 
         return res.strip()
 
-    def get_tooltip(self):
-        lines = []
+    def _format_tooltip(self):
         # show next stops
-        reached_next = False
-        for stop in self.stops:
-            if stop == self.next_stop:
-                reached_next = True
-            if reached_next:
-                lines.append(str(stop))
-        return "\n".join(lines)
+        if self.next_stop_index is None:
+            return ""
+        return "\n".join(str(stop) for stop in self.stops[self.next_stop_index :])
+
+
+def departure_index(stops: list[Stop]) -> list[int]:
+    """
+    returns the latest estimated departure up to each stop, as epoch seconds
+
+    the list is sorted even if delays or missing times make the departures of single
+    stops go backwards, so that it can be bisected
+    """
+    index = []
+    latest = 0
+    for stop in stops:
+        if (time := stop.estimated_departure()) and time.real_timestamp > latest:
+            latest = time.real_timestamp
+        index.append(latest)
+    return index
+
+
+def _delayed_time_from_json(data: dict | None):
+    return DelayedTime.from_json(data) if data is not None else None
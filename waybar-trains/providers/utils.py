@@ -1,20 +1,106 @@
+import bisect
+import dataclasses
 import logging
+import os
 import socket
-from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import wait
+from datetime import datetime
 from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Mapping, NamedTuple
 
-from pyroute2.iwutil import IW
-from pyroute2.netlink import nl80211
+from .cache import read_json, write_json
+from .types import DelayedTime, Status, Stop, departure_index
 
-from .types import Stop
+if TYPE_CHECKING:
+    import requests
+    from pyroute2.netlink import nl80211
 
 _logger = logging.getLogger("waybar-trains")
 
+# providers are probed concurrently, but the networks should only be scanned once
+_scan_lock = threading.Lock()
+
+# seconds for which resolved addresses are reused while connected to the same network
+DNS_CACHE_TTL = 300
+_dns_cache_lock = threading.Lock()
+
+
+class Network(NamedTuple):
+    ssid: str
+    bssid: str | None
+
+
+def run_in_thread[T](
+    function: Callable[..., T], *args, name: str | None = None
+) -> Future[T]:
+    """
+    runs `function` on a new daemon thread, so that it does not keep the process alive
+    if it hangs
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
+
+
+def _get_connected_networks() -> frozenset[Network]:
+    with _scan_lock:
+        return _scan_connected_networks()
+
 
-@lru_cache
 def _get_connected_ssids() -> set[str]:
+    return {network.ssid for network in _get_connected_networks()}
+
+
+def get_network_key() -> str:
+    """returns a key for the connected networks, empty if not connected to any"""
+    return ",".join(
+        sorted(f"{ssid}/{bssid}" for ssid, bssid in _get_connected_networks())
+    )
+
+
+def _has_wifi_link() -> bool:
+    """cheap check via sysfs whether any WiFi interface is associated"""
+    try:
+        interfaces = os.listdir("/sys/class/net")
+    except OSError:
+        return True
+    for interface in interfaces:
+        path = os.path.join("/sys/class/net", interface)
+        if not os.path.exists(os.path.join(path, "phy80211")):
+            continue
+        try:
+            with open(os.path.join(path, "operstate")) as f:
+                if f.read().strip() in ("up", "unknown", "dormant"):
+                    return True
+        except OSError:
+            return True
+    return False
+
+
+@lru_cache
+def _scan_connected_networks() -> frozenset[Network]:
+    if not _has_wifi_link():
+        # avoids importing pyroute2, which takes most of the startup time
+        _logger.debug("No WiFi interface is connected")
+        return frozenset()
+
+    from pyroute2.iwutil import IW
+
     # copied from https://github.com/e1mo/waybar-iceportal/blob/13b297c2cc0b4b56d4caccd626a16b455d8d49e5/waybar-iceportal#L48
-    ssids = set()
+    networks = set()
     with IW() as iw:
         interfaces = [v[0] for v in iw.get_interfaces_dict().values()]
         for ifindex in interfaces:
@@ -24,18 +110,33 @@ def _get_connected_ssids() -> set[str]:
             attr_bss: nl80211.nl80211cmd.bss | None = bss.get_attr("NL80211_ATTR_BSS")
             if attr_bss is None:
                 continue
+            bssid: str | None = attr_bss.get_attr("NL80211_BSS_BSSID")
             info: list[dict] = attr_bss.get_attrs("NL80211_BSS_INFORMATION_ELEMENTS")
-            ssids |= set([d["SSID"].decode("utf-8") for d in info])
-    _logger.debug(f"Found WiFi networks {ssids}")
-    return ssids
+            networks |= set([Network(d["SSID"].decode("utf-8"), bssid) for d in info])
+    _logger.debug(f"Found WiFi networks {networks}")
+    return frozenset(networks)
+
+
+def clear_connection_cache():
+    """forget the connected networks, so they are scanned again on next use"""
+    with _scan_lock:
+        _scan_connected_networks.cache_clear()
 
 
-def is_connected_to_ssid(ssids: set[str]):
+def is_connected_to_ssid(ssids: set[str] | frozenset[str]):
     # check if connected to train network
     return not ssids.isdisjoint(_get_connected_ssids())
 
 
-def resolve_hostname(host: str) -> str:
+@lru_cache
+def get_session() -> "requests.Session":
+    """returns a session shared by all providers"""
+    import requests
+
+    return requests.Session()
+
+
+def _resolve(host: str) -> str:
     return socket.getaddrinfo(
         host=host,
         port=443,
@@ -44,16 +145,142 @@ def resolve_hostname(host: str) -> str:
     )[0][4][0]
 
 
-def estimate_next_stop(stops: list[Stop], now: datetime | None = None):
-    if now is None:
-        now = datetime.now().astimezone()
-    for stop in stops:
-        time = stop.estimated_departure()
-        if time and time.real > now:
-            return stop
+def resolve_hostnames(
+    hosts: Iterable[str], timeout: float | None = None
+) -> dict[str, str | None]:
+    """
+    resolves `hosts` to IPv4 addresses, or None if that fails within `timeout` seconds
+    hosts are resolved concurrently, and the results are cached for the connected network
+    """
+    hosts = set(hosts)
+    network = get_network_key()
+    now = time.time()
+    with _dns_cache_lock:
+        cache = read_json("dns.json") or {}
+    cached = {
+        host: entry["address"]
+        for host, entry in cache.get(network, {}).items()
+        if host in hosts and now - entry["time"] < DNS_CACHE_TTL
+    }
+    futures = {
+        host: run_in_thread(_resolve, host, name=f"resolve-{host}")
+        for host in hosts - cached.keys()
+    }
+    if not futures:
+        return cached
+    wait(futures.values(), timeout)
+    resolved: dict[str, str | None] = {}
+    for host, future in futures.items():
+        try:
+            resolved[host] = future.result(0)
+        except FutureTimeoutError:
+            _logger.warning(f"Resolving {host} timed out")
+            resolved[host] = None
+        except OSError as e:
+            _logger.warning(f"Could not resolve {host}: {e}")
+            resolved[host] = None
+    if network:
+        with _dns_cache_lock:
+            cache = read_json("dns.json") or {}
+            entries = {
+                host: entry
+                for host, entry in cache.get(network, {}).items()
+                if now - entry["time"] < DNS_CACHE_TTL
+            }
+            for host, address in resolved.items():
+                if address is not None:
+                    entries[host] = {"address": address, "time": now}
+            try:
+                # only keep the current network
+                write_json("dns.json", {network: entries})
+            except OSError:
+                _logger.exception("Could not cache resolved addresses")
+    return cached | resolved
+
+
+def select_fields(data: Any, fields: Mapping[str, Mapping | None]) -> Any:
+    """
+    returns a copy of `data` with only the keys in `fields`, whose values are the
+    fields to select from the value of each key, or None to keep the whole value
+    lists are selected from item by item, missing keys are left out
+    """
+    if isinstance(data, list):
+        return [select_fields(item, fields) for item in data]
+    if not isinstance(data, dict):
+        return data
+    return {
+        key: data[key] if subfields is None else select_fields(data[key], subfields)
+        for key, subfields in fields.items()
+        if key in data
+    }
+
+
+def estimate_next_stop(
+    stops: list[Stop], now: datetime | None = None, departures: list[int] | None = None
+):
+    """
+    returns the first stop whose departure is in the future
+
+    `departures` is the `departure_index` of `stops`, e.g. `Status.departures`
+    """
+    now_timestamp = now.timestamp() if now is not None else time.time()
+    if departures is None:
+        departures = departure_index(stops)
+    # first stop with a departure after now, stops without times are skipped because
+    # their index entry is the departure before them
+    index = bisect.bisect_right(departures, now_timestamp)
+    if index < len(stops):
+        return stops[index]
 
     # show last stop for up to 30 minutes after stop's time
     if stops:
-        time = stops[-1].estimated_departure()
-        if time and time.real + timedelta(minutes=30) > now:
+        departure = stops[-1].estimated_departure()
+        if departure and departure.real_timestamp + 30 * 60 > now_timestamp:
             return stops[-1]
+
+
+def advance_next_stop(status: Status, now: datetime | None = None) -> Status:
+    """
+    returns `status` with the next stop estimated again if the train has already
+    departed from it, without asking the provider
+    """
+    next_stop = status.next_stop
+    if next_stop is None:
+        return status
+    departure = next_stop.estimated_departure()
+    now_timestamp = now.timestamp() if now is not None else time.time()
+    if departure is None or departure.real_timestamp > now_timestamp:
+        return status
+    next_stop = estimate_next_stop(status.stops, now, status.departures)
+    if next_stop is status.next_stop:
+        return status
+    return dataclasses.replace(status, next_stop=next_stop)
+
+
+def extrapolate_delay(status: Status) -> Status:
+    """
+    returns `status` with the delay at its next stop applied to the following stops
+    that have less delay, as the train is unlikely to catch up while nobody tells
+    """
+    index = status.next_stop_index
+    if status.next_stop is None or index is None:
+        return status
+    arrival = status.next_stop.arrival or status.next_stop.departure
+    if arrival is None or arrival.delay_seconds <= 0:
+        return status
+    delay = arrival.delay_seconds
+    stops = status.stops[: index + 1] + [
+        dataclasses.replace(
+            stop,
+            arrival=_with_minimum_delay(stop.arrival, delay),
+            departure=_with_minimum_delay(stop.departure, delay),
+        )
+        for stop in status.stops[index + 1 :]
+    ]
+    return dataclasses.replace(status, stops=stops)
+
+
+def _with_minimum_delay(time: DelayedTime | None, delay: int) -> DelayedTime | None:
+    if time is None or time.delay_seconds >= delay:
+        return time
+    return DelayedTime(time.planned_timestamp, delay)
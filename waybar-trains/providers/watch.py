@@ -0,0 +1,62 @@
+import logging
+import select
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pyroute2.netlink.nl80211 import NL80211
+
+_logger = logging.getLogger("waybar-trains")
+
+# nl80211 events of the "mlme" multicast group that change the connected networks
+CONNECTION_EVENTS = (
+    "NL80211_CMD_CONNECT",
+    "NL80211_CMD_DISCONNECT",
+    "NL80211_CMD_ROAM",
+)
+
+
+class ConnectionWatcher:
+    """
+    waits for WiFi connections and disconnections, using nl80211 multicast events
+    instead of scanning the connected networks
+    """
+
+    def __init__(self):
+        # raises if nl80211 is not available, e.g. without any WiFi hardware
+        from pyroute2.netlink.nl80211 import NL80211, NL80211_NAMES
+
+        self._commands = {NL80211_NAMES[name] for name in CONNECTION_EVENTS}
+        self._socket: "NL80211" = NL80211()
+        try:
+            self._socket.bind()
+            self._socket.add_membership("mlme")
+        except:
+            self._socket.close()
+            raise
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        waits up to `timeout` seconds, or forever if None, and returns True as soon as
+        the connected networks change
+        """
+        readable, _, _ = select.select([self._socket.fileno()], [], [], timeout)
+        if not readable:
+            return False
+        changed = False
+        for message in self._socket.get():
+            if message["cmd"] in self._commands:
+                _logger.debug(f"WiFi event {message.get('event', message['cmd'])}")
+                changed = True
+        return changed
+
+    def close(self):
+        self._socket.close()
+
+
+def get_connection_watcher() -> ConnectionWatcher | None:
+    """returns a watcher, or None if connections can only be noticed by scanning"""
+    try:
+        return ConnectionWatcher()
+    except Exception as e:
+        _logger.info(f"Cannot watch WiFi connections, checking periodically ({e})")
+        return None
@@ -1,54 +1,75 @@
 from datetime import datetime
-from zoneinfo import ZoneInfo
 
 from .base import BaseProvider, DummyProviderData
 from .types import DelayedTime, Status, Stop
-from .utils import is_connected_to_ssid, resolve_hostname
 
 
 class ZugportalProvider(BaseProvider):
     NAME = "zugportal"
+    SSIDS = frozenset({"WIFI@DB"})
+    # check if zugportal.de with local ip address is really available
+    LOCAL_HOSTS = {"zugportal.de": "192.168."}
 
-    def _is_connected(self) -> bool:
-        return (
-            is_connected_to_ssid({"WIFI@DB"})
-            and
-            # check if zugportal.de with local ip address is really available
-            # idea from https://github.com/liclac/ambient/blob/75e1d3aee4c1c5ba55d95cf9e14e39afb24879b1/functions.d/ambient_resolve4.fish
-            resolve_hostname("zugportal.de").startswith("192.168.")
-        )
+    # the parts of the journey that are used, see `select_fields`
+    _TIME_FIELDS = {"targetTimeInMs": None, "predictedTimeInMs": None}
+    JOURNEY_FIELDS = {
+        "name": None,
+        "no": None,
+        "category": None,
+        "stops": {
+            "station": {"name": None, "evaNo": None},
+            "arrivalTime": _TIME_FIELDS,
+            "departureTime": _TIME_FIELDS,
+            "track": {"prediction": None},
+        },
+    }
 
     def _fetch_data(self) -> dict:
-        return self._session.get(
-            "https://zugportal.de/@prd/zupo-travel-information/api/public/ri/journey"
-        ).json()
+        return self._get_json(
+            "https://zugportal.de/@prd/zupo-travel-information/api/public/ri/journey",
+            fields=self.JOURNEY_FIELDS,
+        )
 
     def _get_dummy_data(self) -> DummyProviderData[dict]:
+        from zoneinfo import ZoneInfo
+
         return DummyProviderData(
             self._read_dummy_data("2024-05-10T19-40-10-db-re4430/journey.json"),
             datetime(2024, 5, 10, 19, 40, 10, tzinfo=ZoneInfo("Europe/Berlin")),
         )
 
     def _get_status_from_data(self, data: dict) -> Status | None:
-        def parse_time(time: dict | None):
+        def time_key(time: dict | None):
             if time is None:
                 return None
-            return DelayedTime.from_timestamps_ms(
-                time["targetTimeInMs"],
-                time["predictedTimeInMs"],
-            )
+            return time["targetTimeInMs"], time["predictedTimeInMs"]
 
-        def parse_stop(stop: dict):
+        def stop_key(stop: dict):
             station = stop["station"]
+            return (
+                station["name"],
+                station["evaNo"],
+                time_key(stop.get("arrivalTime")),
+                time_key(stop.get("departureTime")),
+                stop["track"]["prediction"],
+            )
+
+        def parse_time(time: tuple[int, int] | None):
+            if time is None:
+                return None
+            return DelayedTime.from_timestamps_ms(*time)
+
+        def parse_stop(key: tuple):
+            name, id, arrival, departure, track = key
             return Stop(
-                name=station["name"],
-                id=station["evaNo"],
-                arrival=parse_time(stop.get("arrivalTime")),
-                departure=parse_time(stop.get("departureTime")),
-                track=stop["track"]["prediction"],
+                name=name,
+                id=id,
+                arrival=parse_time(arrival),
+                departure=parse_time(departure),
+                track=track,
             )
 
-        stops = [parse_stop(stop) for stop in data["stops"]]
+        stops = self._parse_stops(data["stops"], stop_key, parse_stop)
         return Status(
             self.NAME,
             line=data["name"],